@@ -1,3 +1,4 @@
+import logging
 import os
 from pathlib import Path
 
@@ -14,6 +15,8 @@ except ImportError:
 
 import latdraw.lattice as lattice
 
+logger = logging.getLogger(__name__)
+
 
 class FileTypeError(RuntimeError):
     pass
@@ -21,6 +24,12 @@ class FileTypeError(RuntimeError):
 class UnknownElementType(RuntimeError):
     pass
 
+def _checked(beamline, fname, check_continuity=True):
+    report = beamline.validate(check_continuity=check_continuity)
+    if not report.ok:
+        logger.warning("Problems found in %s:\n%s", fname, report)
+    return beamline
+
 def read(fname):
     """Generatl reader function"""
     try:
@@ -40,8 +49,9 @@ def read_madx(fname):
     if file_type not in {"SURVEY", "TWISS"}:
         raise FileTypeError(f"Unsupported TFS TYPE in header: {file_type}")
 
-    latdraw_sequence = _loop_madx_df(df, survey=file_type == "SURVEY")
-    return lattice.Beamline(latdraw_sequence)
+    survey = file_type == "SURVEY"
+    latdraw_sequence = _loop_madx_df(df, survey=survey)
+    return _checked(lattice.Beamline(latdraw_sequence), fname, check_continuity=not survey)
 
 def read_madx_survey(survey, twiss=None):
     # Optional twiss so for example the quads etc. point in the correct direction...
@@ -80,7 +90,7 @@ def _loop_madx_df(tfs_df, survey):
         elif keyword == "SEXTUPOLE":
             yield lattice.Sextupole(name, position, length, k2)
         elif keyword == "OCTUPOLE":
-            yield lattice.Sextupole(name, position, length, k3)
+            yield lattice.Octupole(name, position, length, k3)
         elif keyword == "HKICKER":
             yield lattice.HKicker(name, position, length, tup.ANGLE)
         elif keyword == "VKICKER":
@@ -110,7 +120,7 @@ def read_mad8(fname):
         )
 
     latdraw_sequence = list(_loop_mad8_df(df, survey))
-    return lattice.Beamline(latdraw_sequence)
+    return _checked(lattice.Beamline(latdraw_sequence), fname, check_continuity=not survey)
 
 def _loop_mad8_df(mad8_df, is_survey):
     for tup in mad8_df.itertuples():
@@ -134,7 +144,7 @@ def _loop_mad8_df(mad8_df, is_survey):
         elif keyword == "SEXT":
             yield lattice.Sextupole(name, position, length, tup.K2)
         elif keyword == "OCTU":
-            yield lattice.Sextupole(name, position, length, tup.K3)
+            yield lattice.Octupole(name, position, length, tup.K3)
         elif keyword == "HKIC":
             yield lattice.HKicker(name, position, length, tup.ANGLE)
         elif keyword == "VKIC":
@@ -173,7 +183,8 @@ def read_bdsim_survey(fname, straighten=False):
     bdsim_survey_df.columns = new_columns
 
     latdraw_sequence = list(_loop_bdsim_survey_df(bdsim_survey_df, straighten))
-    return lattice.Beamline(latdraw_sequence)
+    # Lengths here are chord lengths, so bends never quite meet in s.
+    return _checked(lattice.Beamline(latdraw_sequence), fname, check_continuity=False)
 
 def _loop_bdsim_survey_df(bdsim_survey_df, straighten=False):
     ignoreable_types = {"dipolefringe"}
@@ -203,7 +214,7 @@ def _loop_bdsim_survey_df(bdsim_survey_df, straighten=False):
         elif keyword == "sextupol":
             yield lattice.Sextupole(name, position, length, tup.k2)
         elif keyword == "octupole":
-            yield lattice.Sextupole(name, position, length, tup.k3)
+            yield lattice.Octupole(name, position, length, tup.k3)
         elif keyword == "hkicker":
             yield lattice.HKicker(name, position, length, tup.Angle)
         elif keyword == "vkicker":
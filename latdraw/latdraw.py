@@ -5,12 +5,17 @@ from math import copysign
 
 import matplotlib.patches as patches
 import matplotlib.pyplot as plt
+import numpy as np
 from adjustText import adjust_text
 
 import latdraw.lattice as lattice
 
 MAGNET_WIDTH = 0.1
 
+# Rough width of a character in units of the font size, used to size labels
+# without having to render them.
+CHARACTER_ASPECT = 0.6
+
 DEFAULT_COLOUR_MAP = {lattice.Quadrupole: "red",
                       lattice.SBend: "blue",
                       lattice.RBend: "blue",
@@ -26,11 +31,21 @@ DEFAULT_COLOUR_MAP = {lattice.Quadrupole: "red",
                       lattice.GenericMap: "gray",
                       lattice.Solenoid: "pink",
                       lattice.Sextupole: "green",
+                      lattice.Octupole: "darkgreen",
                       lattice.TransverseDeflectingCavity: "orange",
                       lattice.Undulator: "cyan"
 }
 
-def draw(fig, axes, sequence, colour_map=None, annotate=True, dimension="x", magnet_width=MAGNET_WIDTH, **drawlinekw):
+def draw(fig, axes, sequence, colour_map=None, annotate=True, dimension="x", magnet_width=MAGNET_WIDTH,
+         labels=None, label_lanes=3, label_fontsize=8, **drawlinekw):
+    """Draw the sequence onto the axes.
+
+    labels is an optional collection of element types (e.g. [Quadrupole,
+    Monitor]) whose names are drawn permanently.  They are stacked into
+    label_lanes rows and labels that do not fit at the current zoom are
+    hidden; the layout is redone whenever the view changes.
+
+    """
 
     draw_line(axes, sequence, dimension=dimension,  **drawlinekw)
     if colour_map is None:
@@ -118,6 +133,88 @@ def draw(fig, axes, sequence, colour_map=None, annotate=True, dimension="x", mag
     fig.canvas.mpl_connect('pick_event', on_pick)
     fig.canvas.mpl_connect('key_press_event', on_press)
 
+    if labels:
+        labelled = [element for element in sequence if isinstance(element, tuple(labels))]
+        static_labels = StaticLabels(axes, labelled, nlanes=label_lanes, fontsize=label_fontsize)
+        # Connect lambdas rather than bound methods: matplotlib only keeps weak
+        # references to the latter, which would let static_labels be collected.
+        axes.callbacks.connect("xlim_changed", lambda _: static_labels.update())
+        fig.canvas.mpl_connect("resize_event", lambda _: static_labels.update())
+
+
+def layout_labels(starts, widths, nlanes):
+    """Greedily stack labels into lanes sweeping along s.
+
+    starts must be sorted.  Each label goes into the first lane that is free
+    at its start, otherwise it is dropped.  Returns the lane of each label,
+    with -1 for dropped labels.
+
+    """
+    lanes = np.full(len(starts), -1, dtype=int)
+    lane_ends = [-np.inf] * nlanes
+    for i, (start, width) in enumerate(zip(np.asarray(starts).tolist(), np.asarray(widths).tolist())):
+        for lane, end in enumerate(lane_ends):
+            if start >= end:
+                lanes[i] = lane
+                lane_ends[lane] = start + width
+                break
+    return lanes
+
+
+class StaticLabels:
+    """Names of a set of elements drawn along the top of a lattice axes.
+
+    Only the labels placed in the current view have Text artists.  These are
+    kept in a pool that grows to the most labels shown at once and is reused
+    on every update.
+
+    """
+    def __init__(self, axes, elements, nlanes=3, fontsize=8):
+        self.axes = axes
+        self.nlanes = nlanes
+        self.fontsize = fontsize
+
+        elements = sorted(elements, key=lambda element: element.position[2] - 0.5 * element.length)
+        self._s = np.array([element.position[2] - 0.5 * element.length for element in elements])
+        self._names = [element.name for element in elements]
+        # One extra character of padding between neighbouring labels.
+        self._widths = np.array([len(name) + 1 for name in self._names]) * fontsize * CHARACTER_ASPECT
+
+        self._texts = []
+        self.update()
+
+    def lane_height(self, lane):
+        # Fill the top half of the axes, first lane at the top.
+        return 1 - (lane + 0.5) / self.nlanes * 0.5
+
+    def _text(self, i):
+        if i == len(self._texts):
+            # x in data coordinates, y as a fraction of the axes height.
+            self._texts.append(self.axes.text(0, 1, "", transform=self.axes.get_xaxis_transform(),
+                                              fontsize=self.fontsize, horizontalalignment="left",
+                                              verticalalignment="center", clip_on=True))
+        return self._texts[i]
+
+    def update(self):
+        placed = lanes = np.array([], dtype=int)
+        xmin, xmax = sorted(self.axes.get_xlim())
+        width_in_points = self.axes.bbox.width * 72 / self.axes.figure.dpi
+        if width_in_points > 0:
+            metres_per_point = (xmax - xmin) / width_in_points
+            first, last = np.searchsorted(self._s, [xmin, xmax])
+            lanes = layout_labels(self._s[first:last], self._widths[first:last] * metres_per_point, self.nlanes)
+            placed, = np.nonzero(lanes >= 0)
+            lanes = lanes[placed]
+            placed += first
+
+        for i, (label, lane) in enumerate(zip(placed, lanes)):
+            text = self._text(i)
+            text.set_text(self._names[label])
+            text.set_position((self._s[label], self.lane_height(lane)))
+            text.set_visible(True)
+        for text in self._texts[len(placed):]:
+            text.set_visible(False)
+
 
 def draw_line(axes, sequence, dimension="x", **plotkw):
     positions = [t.position for t in sequence]
@@ -35,8 +35,35 @@ class Beamline(Sequence):
         for element in self:
             element.position += position
 
+    def to_records(self):
+        """Flatten the beamline into a numpy structured array, one row per
+        element.  Only the name, type, position, length and strengths are
+        kept, the misc dicts are dropped.
+
+        """
+        return elements_to_records(self)
+
+    @classmethod
+    def from_records(cls, records):
+        return cls(element_from_record(record) for record in records)
+
+    def compress(self, max_period=64, tolerance=None):
+        return CompressedBeamline(self, max_period=max_period, tolerance=tolerance)
+
+    def element_indices(self, s):
+        return element_indices(self, s)
+
+    def sample(self, s, attribute, integrated=False):
+        return sample(self, s, attribute, integrated=integrated)
+
+    def validate(self, check_continuity=True, tolerance=1e-6):
+        return validate(self, check_continuity=check_continuity, tolerance=tolerance)
+
 
 class Element:
+    # Attributes passed positionally to __init__ after the length.
+    strengths = ()
+
     def __init__(self, name, position, length, **misc):
         """For now position is the END?  survey and S can be dengerate, x and y
         just stay 0...
@@ -72,6 +99,8 @@ class Drift(Element):
 
 
 class SimpleDipole(Element):
+    strengths = ("angle",)
+
     def __init__(self, name, position, length, angle, **misc):
         super().__init__(name, position, length, **misc)
         self.angle = angle
@@ -105,6 +134,8 @@ class Kicker(SimpleDipole):
 
 
 class Quadrupole(Element):
+    strengths = ("k1",)
+
     def __init__(self, name, position, length, k1, **misc):
         super().__init__(name, position, length, **misc)
         self.k1 = k1
@@ -119,12 +150,16 @@ class Quadrupole(Element):
     #     return self.k1
 
 class Sextupole(Element):
+    strengths = ("k2",)
+
     def __init__(self, name, position, length, k2, **misc):
         super().__init__(name, position, length, **misc)
         self.k2 = k2
 
 
 class Octupole(Element):
+    strengths = ("k3",)
+
     def __init__(self, name, position, length, k3, **misc):
         super().__init__(name, position, length, **misc)
         self.k3 = k3
@@ -135,6 +170,8 @@ class RFCavity(Element):
 
 
 class Solenoid(Element):
+    strengths = ("ks",)
+
     def __init__(self, name, position, length, ks, **misc):
         super().__init__(name, position, length, **misc)
         self.ks = ks
@@ -152,6 +189,8 @@ class GenericMap(Element):
 
 
 class TransverseDeflectingCavity(Element):
+    strengths = ("voltage",)
+
     def __init__(self, name, position, length, voltage, **misc):
         super().__init__(name, position, length, **misc)
         self.voltage = voltage
@@ -159,3 +198,428 @@ class TransverseDeflectingCavity(Element):
 
 class Undulator(Element):
     pass
+
+
+RECORD_STRENGTHS = ("k1", "k2", "k3", "angle", "ks", "voltage")
+
+# Order defines the type codes used by Beamline.to_records, so only ever append.
+ELEMENT_TYPES = (Element, ThinElement, Marker, Monitor, Drift,
+                 SimpleDipole, RBend, SBend, HKicker, VKicker, Kicker,
+                 Quadrupole, Sextupole, Octupole, RFCavity, Solenoid,
+                 Collimator, Cavity, GenericMap, TransverseDeflectingCavity,
+                 Undulator)
+
+def record_dtype(name_width=1):
+    fields = [("type", np.int16),
+              ("name", f"U{max(name_width, 1)}"),
+              ("position", np.float64, (3,)),
+              ("length", np.float64)]
+    fields.extend((strength, np.float64) for strength in RECORD_STRENGTHS)
+    return np.dtype(fields)
+
+
+def elements_to_records(elements):
+    elements = list(elements)
+    names = [str(element.name) for element in elements]
+    name_width = max(map(len, names), default=1)
+    records = np.zeros(len(elements), dtype=record_dtype(name_width))
+
+    # Gather each column in one pass and assign whole columns at once, which is
+    # much faster than filling the structured array row by row.
+    type_codes = {element_type: code for code, element_type in enumerate(ELEMENT_TYPES)}
+    try:
+        records["type"] = [type_codes[type(element)] for element in elements]
+    except KeyError as e:
+        raise TypeError(f"Unsupported element type: {e.args[0].__name__}")
+    records["name"] = names
+    records["position"] = [element.position for element in elements] or np.zeros((0, 3))
+    records["length"] = [element.length for element in elements]
+    for strength in RECORD_STRENGTHS:
+        records[strength] = [getattr(element, strength) if strength in element.strengths else 0
+                             for element in elements]
+
+    return records
+
+
+def element_from_record(record):
+    element_type = ELEMENT_TYPES[record["type"]]
+    name = str(record["name"])
+    position = np.array(record["position"])
+
+    if issubclass(element_type, ThinElement):
+        return element_type(name, position)
+
+    strengths = [float(record[strength]) for strength in element_type.strengths]
+    return element_type(name, position, float(record["length"]), *strengths)
+
+
+class CompressedBeamline(Sequence):
+    """A Beamline with repeated cells stored only once.
+
+    Runs of a cell repeated back to back (same element types, lengths,
+    strengths and misc, up to max_period elements long) are stored as a single
+    prototype cell plus the position offset of each repetition.  Identical
+    cells found in different places share the same prototype.  Elements are
+    rebuilt from the prototypes on access, so modifying one does not modify
+    the beamline; use add_offset to move the whole thing.
+
+    Repetitions must be related by a pure translation, so cells in survey
+    coordinates of a curved machine are only compressed where the machine is
+    straight.  Positions only have to agree to within tolerance (in metres),
+    so that positions read from files with limited precision still compress.
+    It defaults to 1e-8 of the largest coordinate, but at least 1 um.
+    Expanded positions can therefore differ from the originals by up to
+    tolerance.
+
+    """
+    def __init__(self, items, max_period=64, tolerance=None):
+        elements = list(items)
+        self._names = [element.name for element in elements]
+        self._cells = []
+        block_cells = []
+        block_starts = []
+        self._offsets = []
+
+        if not elements:
+            self._block_cells = np.array(block_cells, dtype=int)
+            self._block_starts = np.array(block_starts, dtype=int)
+            return
+
+        positions = np.array([element.position for element in elements], dtype=float)
+        signatures = {}
+        ids = np.array([signatures.setdefault(_signature(element), len(signatures))
+                        for element in elements])
+        if tolerance is None:
+            tolerance = max(1e-6, 1e-8 * np.abs(positions).max())
+        # Cells with the same elements, each with its relative positions, so
+        # that cells found in different places can share a prototype.
+        cell_ids = {}
+
+        for start, period, repeats in _find_repeats(ids, positions, max_period, tolerance):
+            stop = start + period
+            offset = positions[start]
+            relative = positions[start:stop] - offset
+            candidates = cell_ids.setdefault(ids[start:stop].tobytes(), [])
+
+            for candidate_relative, cell_index in candidates:
+                if np.allclose(relative, candidate_relative, rtol=0, atol=tolerance):
+                    break
+            else:
+                cell_index = len(self._cells)
+                candidates.append((relative, cell_index))
+                cell = []
+                for element, position in zip(elements[start:stop], relative):
+                    prototype = _shallow_copy(element)
+                    prototype.position = position
+                    cell.append(prototype)
+                self._cells.append(cell)
+
+            block_cells.append(cell_index)
+            block_starts.append(start)
+            self._offsets.append(positions[start:start + period * repeats:period].copy())
+
+        self._block_cells = np.array(block_cells, dtype=int)
+        self._block_starts = np.array(block_starts, dtype=int)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return Beamline(self[i] for i in range(*key.indices(len(self))))
+
+        index = range(len(self))[key]  # Normalises negative indices, raises IndexError.
+        block = np.searchsorted(self._block_starts, index, side="right") - 1
+        cell = self._cells[self._block_cells[block]]
+        repeat, i = divmod(index - self._block_starts[block], len(cell))
+        return self._expand(cell[i], self._offsets[block][repeat], self._names[index])
+
+    def __iter__(self):
+        names = iter(self._names)
+        for cell_index, offsets in zip(self._block_cells, self._offsets):
+            cell = self._cells[cell_index]
+            for offset in offsets:
+                for prototype in cell:
+                    yield self._expand(prototype, offset, next(names))
+
+    @staticmethod
+    def _expand(prototype, offset, name):
+        element = _shallow_copy(prototype)
+        element.name = name
+        element.position = prototype.position + offset
+        element.misc = dict(prototype.misc)
+        return element
+
+    @property
+    def ncells(self):
+        return len(self._cells)
+
+    def add_offset(self, position):
+        for offsets in self._offsets:
+            offsets += position
+
+    def decompress(self):
+        return Beamline(self)
+
+    def element_indices(self, s):
+        return element_indices(self, s)
+
+    def sample(self, s, attribute, integrated=False):
+        return sample(self, s, attribute, integrated=integrated)
+
+    def validate(self, check_continuity=True, tolerance=1e-6):
+        return validate(self, check_continuity=check_continuity, tolerance=tolerance)
+
+
+def _shallow_copy(element):
+    # Same as copy.copy for Elements but several times faster.
+    duplicate = object.__new__(type(element))
+    duplicate.__dict__.update(element.__dict__)
+    return duplicate
+
+
+def _signature(element):
+    strengths = tuple(getattr(element, strength) for strength in element.strengths)
+    misc = tuple(sorted(element.misc.items()))
+    try:
+        hash(misc)
+    except TypeError:
+        # Unhashable misc values can't be compared cheaply, so never merge
+        # such an element with any other.
+        misc = object()
+    return type(element), element.length, strengths, misc
+
+
+def _run_lengths(mask):
+    """Number of consecutive True values starting at each index of mask."""
+    index = np.arange(len(mask))
+    false_at = np.where(mask, len(mask), index)
+    next_false = np.minimum.accumulate(false_at[::-1])[::-1]
+    return next_false - index
+
+
+def _find_repeats(ids, positions, max_period, tolerance):
+    """Split the lattice greedily into (start, period, repeats) blocks.
+
+    ids[i:i + k * period] repeats a cell of length period k times exactly when
+    ids[j] == ids[j + period] for all j in [i, i + (k - 1) * period), so the
+    number of repeats at each position follows from run lengths of that
+    comparison.  At each position the period covering the most elements wins,
+    ties going to the shortest.  Consecutive unrepeated elements are grouped
+    into a single block with repeats = 1.
+
+    """
+    n = len(ids)
+    periods = np.arange(1, min(max_period, n // 2) + 1)
+    if not len(periods):
+        yield 0, n, 1
+        return
+
+    runs = np.zeros((len(periods), n), dtype=np.int32)
+    for row, period in enumerate(periods):
+        same = ids[period:] == ids[:-period]
+        runs[row, :n - period] = _run_lengths(same)
+    # Positions where at least one period repeats at least twice.  Anything
+    # between them can only be unrepeated, so is skipped over in one go.
+    candidates = np.flatnonzero((runs >= periods[:, np.newaxis]).any(axis=0))
+
+    literal_start = None
+    i = 0
+    while i < n:
+        if not _is_candidate(candidates, i):
+            if literal_start is None:
+                literal_start = i
+            i = _next_candidate(candidates, i, n)
+            continue
+
+        repeats = 1 + runs[:, i] // periods
+        coverage = np.where(repeats > 1, repeats * periods, 0)
+        best = int(np.argmax(coverage))
+        period = int(periods[best])
+        repeats = _translated_repeats(positions, i, period, int(repeats[best]), tolerance)
+
+        if repeats > 1:
+            if literal_start is not None:
+                yield literal_start, i - literal_start, 1
+                literal_start = None
+            yield i, period, repeats
+            i += period * repeats
+        else:
+            if literal_start is None:
+                literal_start = i
+            i += 1
+
+    if literal_start is not None:
+        yield literal_start, n - literal_start, 1
+
+
+def _is_candidate(candidates, i):
+    j = np.searchsorted(candidates, i)
+    return j < len(candidates) and candidates[j] == i
+
+
+def _next_candidate(candidates, i, n):
+    j = np.searchsorted(candidates, i, side="right")
+    return int(candidates[j]) if j < len(candidates) else n
+
+
+def _translated_repeats(positions, start, period, repeats, tolerance):
+    """Number of leading repeats that are a pure translation of the first."""
+    cells = positions[start:start + period * repeats].reshape(repeats, period, 3)
+    relative = cells - cells[:, :1]
+    matches = np.all(np.isclose(relative, relative[0], rtol=0, atol=tolerance), axis=(1, 2))
+    return int(np.argmin(matches)) if not matches.all() else repeats
+
+
+def element_indices(elements, s):
+    """Index of the element occupying each s, or -1 where there is none.
+
+    Each element occupies [end - length, end), with the end taken from the z
+    position, so thin elements never occupy any s.  Where several elements
+    contain s, the one ending first wins if it is also the first element to
+    end after s, which gives elements nested inside another (e.g. a
+    quadrupole in a solenoid) precedence.  Otherwise the containing element
+    reaching furthest wins.
+
+    """
+    ends = np.array([element.position[2] for element in elements], dtype=float)
+    lengths = np.array([element.length for element in elements], dtype=float)
+    return _element_indices(ends, lengths, s)
+
+
+def _element_indices(ends, lengths, s):
+    s = np.asarray(s, dtype=float)
+    flat_s = s.ravel()
+    starts = ends - lengths
+    thick, = np.nonzero(lengths > 0)
+    indices = np.full(flat_s.shape, -1, dtype=int)
+
+    # First pass: the element ending next after s, if it has started by s.
+    by_end = thick[np.argsort(ends[thick], kind="stable")]
+    i = np.searchsorted(ends[by_end], flat_s, side="right")
+    inside = i < len(by_end)
+    indices[inside] = by_end[i[inside]]
+    found = indices >= 0
+    found[found] = starts[indices[found]] <= flat_s[found]
+    indices[~found] = -1
+
+    # Second pass for the misses, which may still lie inside a longer element
+    # that started earlier: of the elements starting by s, take the one
+    # reaching furthest.
+    missed, = np.nonzero(~found)
+    if len(missed) and len(thick):
+        by_start = thick[np.argsort(starts[thick], kind="stable")]
+        ends_by_start = ends[by_start]
+        reach = np.maximum.accumulate(ends_by_start)
+        positions = np.arange(len(by_start))
+        furthest = np.maximum.accumulate(np.where(ends_by_start == reach, positions, 0))
+
+        j = np.searchsorted(starts[by_start], flat_s[missed], side="right") - 1
+        contained = j >= 0
+        contained[contained] = reach[j[contained]] > flat_s[missed[contained]]
+        indices[missed[contained]] = by_start[furthest[j[contained]]]
+
+    return indices.reshape(s.shape)
+
+
+def sample(elements, s, attribute, integrated=False):
+    """Piecewise-constant profile of an element attribute at the points s.
+
+    attribute is any element attribute, e.g. "k1" or "angle", with elements
+    that lack it and positions outside any element sampled as 0.  With
+    integrated=True the attribute is multiplied by the element length (e.g.
+    k1L rather than k1).  attribute="type" instead gives the element type
+    names, with "" outside any element.
+
+    """
+    elements = list(elements)
+    ends = np.array([element.position[2] for element in elements], dtype=float)
+    lengths = np.array([element.length for element in elements], dtype=float)
+    indices = _element_indices(ends, lengths, s)
+    found = indices >= 0
+
+    if attribute == "type":
+        names = np.array([type(element).__name__ for element in elements] + [""])
+        return names[indices]  # -1 picks the trailing "".
+
+    values = np.array([getattr(element, attribute, 0) for element in elements], dtype=float)
+    if integrated:
+        values *= lengths
+
+    profile = np.zeros(indices.shape)
+    profile[found] = values[indices[found]]
+    return profile
+
+
+# Elements that cannot sensibly have zero length.
+MAGNET_TYPES = (SimpleDipole, RBend, SBend, Quadrupole, Sextupole, Octupole, Solenoid)
+
+
+class ValidationReport:
+    """Indices of the elements failing each check done by validate."""
+    checks = {"decreasing_s": "s decreases",
+              "gaps": "gap before element",
+              "overlaps": "overlaps previous element",
+              "zero_length_magnets": "zero length magnet",
+              "non_finite_geometry": "NaN or infinite position or length",
+              "non_finite_strengths": "NaN or infinite strength"}
+
+    def __init__(self, names, **failures):
+        self.names = names
+        for check in self.checks:
+            setattr(self, check, failures.get(check, np.array([], dtype=int)))
+
+    @property
+    def ok(self):
+        return not any(len(getattr(self, check)) for check in self.checks)
+
+    def __str__(self):
+        if self.ok:
+            return "Beamline OK"
+        lines = []
+        for check, description in self.checks.items():
+            indices = getattr(self, check)
+            if not len(indices):
+                continue
+            examples = ", ".join(f"{self.names[i]} ({i})" for i in indices[:5])
+            more = f" and {len(indices) - 5} more" if len(indices) > 5 else ""
+            lines.append(f"{description}: {examples}{more}")
+        return "\n".join(lines)
+
+
+def validate(elements, check_continuity=True, tolerance=1e-6):
+    """Check a sequence of elements for problems that would give misleading
+    plots, returning a ValidationReport.
+
+    The elements are flattened once into records and every check is then done
+    on whole arrays.  With check_continuity, the z positions are taken to be s
+    and checked to be non-decreasing, and each element's start (end minus
+    length) to meet the previous element's end to within tolerance.  Turn it
+    off for survey coordinates of curved machines, where z is not s.
+
+    """
+    records = elements_to_records(elements)
+    failures = {}
+
+    if check_continuity and len(records) > 1:
+        ends = records["position"][:, 2]
+        starts = ends - records["length"]
+        step = starts[1:] - ends[:-1]
+        decreasing = np.diff(ends) < -tolerance
+        failures["decreasing_s"] = np.flatnonzero(decreasing) + 1
+        failures["gaps"] = np.flatnonzero(step > tolerance) + 1
+        # An element that goes backwards in s always overlaps its predecessor,
+        # so only report it once.
+        failures["overlaps"] = np.flatnonzero((step < -tolerance) & ~decreasing) + 1
+
+    magnet = np.isin(records["type"], [ELEMENT_TYPES.index(element_type) for element_type in MAGNET_TYPES])
+    failures["zero_length_magnets"] = np.flatnonzero(magnet & (records["length"] == 0))
+
+    # NaN compares False with everything, so the checks above can't see it.
+    failures["non_finite_geometry"] = np.flatnonzero(~np.isfinite(records["position"]).all(axis=1)
+                                                     | ~np.isfinite(records["length"]))
+
+    strengths = np.column_stack([records[strength] for strength in RECORD_STRENGTHS])
+    failures["non_finite_strengths"] = np.flatnonzero(~np.isfinite(strengths).all(axis=1))
+
+    return ValidationReport(records["name"], **failures)
@@ -0,0 +1,116 @@
+"""Share a Beamline between processes without pickling every Element.
+
+The publishing process flattens the beamline into a structured array (see
+Beamline.to_records) and copies it once into a named shared memory block.
+Worker processes attach to that block by its (small, picklable) handle and
+build Element instances from it lazily, so attaching costs the same however
+long the lattice is.
+
+Typical use::
+
+    with SharedBeamline(beamline) as shared:
+        pool.map(work, [shared.handle] * nworkers)
+
+    def work(handle):
+        with attach(handle) as beamline:
+            ...
+
+"""
+
+from collections import namedtuple
+from collections.abc import Sequence
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+import latdraw.lattice as lattice
+
+SharedBeamlineHandle = namedtuple("SharedBeamlineHandle", ["name", "length", "dtype"])
+
+
+def _open_shared_memory(name):
+    # Attaching processes must not register the block with the resource
+    # tracker, otherwise it gets unlinked as soon as the first worker exits.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no track argument
+        pass
+
+    # Before 3.13 attaching always registers.  Undo that, but only if the
+    # tracker was started just for us: forked and spawned workers share the
+    # owner's tracker, where it would drop the owner's own registration.
+    own_tracker = resource_tracker._resource_tracker._fd is None
+    shm = shared_memory.SharedMemory(name=name)
+    if own_tracker:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class SharedBeamline:
+    """Owner of a Beamline published to shared memory.
+
+    The block lives until unlink is called (done automatically when used as a
+    context manager), so the owner must outlive all of its workers.
+
+    """
+    def __init__(self, beamline):
+        records = lattice.elements_to_records(beamline)
+        # A zero-sized block is not allowed.
+        self._shm = shared_memory.SharedMemory(create=True, size=max(records.nbytes, 1))
+        self.records = np.ndarray(records.shape, dtype=records.dtype, buffer=self._shm.buf)
+        self.records[:] = records
+        self.handle = SharedBeamlineHandle(self._shm.name, len(records), records.dtype)
+
+    def close(self):
+        self.records = None
+        self._shm.close()
+
+    def unlink(self):
+        self.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.unlink()
+
+
+class AttachedBeamline(Sequence):
+    """Read-only view of a SharedBeamline in another process.
+
+    Elements are built from the shared records on access, so each one is a
+    fresh copy: changing it does not change the shared data.  Use the records
+    attribute directly for vectorised access to positions, lengths and
+    strengths.
+
+    """
+    def __init__(self, handle):
+        self._shm = _open_shared_memory(handle.name)
+        self.records = np.ndarray((handle.length,), dtype=handle.dtype, buffer=self._shm.buf)
+        self.records.flags.writeable = False
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return lattice.Beamline.from_records(self.records[key])
+        return lattice.element_from_record(self.records[key])
+
+    def __len__(self):
+        return len(self.records)
+
+    def to_beamline(self):
+        return lattice.Beamline.from_records(self.records)
+
+    def close(self):
+        self.records = None
+        self._shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def attach(handle):
+    return AttachedBeamline(handle)
@@ -0,0 +1,270 @@
+"""Serve pre-rendered PNG tiles of lattices over local HTTP.
+
+At zoom level n the s-range of a lattice is split into 2**n equal tiles, and
+tile i is available at::
+
+    http://host:port/<lattice>/<n>/<i>.png
+
+with the tiling of each lattice described at /<lattice>/info.json.  Tiles are
+rendered on demand by a pool of worker processes using the Agg backend and
+cached on disk, so each tile is only ever drawn once per version of the
+lattice file.  Both the server and the workers keep recently used lattices
+parsed in an LRU cache.
+
+Run with::
+
+    python -m latdraw.tiles xfel=path/to/twiss.tfs --port 8000
+
+"""
+
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import latdraw.interfaces as interfaces
+from latdraw.latdraw import draw
+
+TILE_WIDTH = 512
+TILE_HEIGHT = 64
+DPI = 100
+MAX_ZOOM = 20
+LATTICE_CACHE_SIZE = 8
+# Workers are started from the server's request threads, where forking could
+# copy a lock held by another thread and deadlock the child.
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+_TILE_PATH = re.compile(r"^/(?P<lattice>[^/]+)/(?P<zoom>\d+)/(?P<index>\d+)\.png$")
+_INFO_PATH = re.compile(r"^/(?P<lattice>[^/]+)/info\.json$")
+
+
+class UnknownTile(LookupError):
+    pass
+
+
+class UnsupportedLattice(RuntimeError):
+    pass
+
+
+class _ParsedLattice:
+    def __init__(self, beamline):
+        self.beamline = beamline
+        self.ends = np.array([element.position[2] for element in beamline], dtype=float)
+        if not len(self.ends):
+            raise UnsupportedLattice("Lattice has no elements")
+        # Tiles are cut in s, and z is only s for non-survey lattices.
+        if not np.all(np.diff(self.ends) >= 0):
+            raise UnsupportedLattice("Element positions must be non-decreasing in s, "
+                                     "survey files are not supported")
+        starts = self.ends - np.array([element.length for element in beamline])
+        self.s_min = starts.min()
+        self.s_max = self.ends.max()
+
+    def tile_range(self, zoom, index):
+        span = (self.s_max - self.s_min) / 2**zoom
+        s0 = self.s_min + index * span
+        return s0, s0 + span
+
+    def elements_between(self, s0, s1):
+        # One extra element either side keeps the line continuous across tiles.
+        first = max(np.searchsorted(self.ends, s0, side="left") - 1, 0)
+        last = np.searchsorted(self.ends, s1, side="right") + 1
+        return self.beamline[first:last]
+
+
+@functools.lru_cache(maxsize=LATTICE_CACHE_SIZE)
+def _parse(path, mtime_ns):
+    # mtime_ns is part of the key so that edited files are re-read.
+    return _ParsedLattice(interfaces.read(path))
+
+
+def _load(path):
+    return _parse(path, os.stat(path).st_mtime_ns)
+
+
+def render_tile(path, zoom, index, out_path, width=TILE_WIDTH, height=TILE_HEIGHT):
+    """Draw one tile of the lattice at path and write it to out_path as a PNG."""
+    parsed = _load(path)
+    s0, s1 = parsed.tile_range(zoom, index)
+
+    fig = Figure(figsize=(width / DPI, height / DPI), dpi=DPI)
+    FigureCanvasAgg(fig)
+    axes = fig.add_axes([0, 0, 1, 1])
+    draw(fig, axes, parsed.elements_between(s0, s1), annotate=False)
+    axes.set_xlim(s0, s1)
+    axes.set_ylim(-0.25, 0.25)
+    axes.set_axis_off()
+
+    # Write then rename so that a half-written tile is never served.
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=out_path.parent, suffix=".png", delete=False) as f:
+        fig.savefig(f, format="png")
+    os.replace(f.name, out_path)
+    return out_path
+
+
+class TileRenderer:
+    def __init__(self, lattices, cache_dir, workers=None, width=TILE_WIDTH, height=TILE_HEIGHT,
+                 mp_context=None):
+        """lattices maps the names used in URLs to lattice file paths.
+
+        mp_context defaults to a START_METHOD context, not fork.
+
+        """
+        self.lattices = {name: os.fspath(path) for name, path in lattices.items()}
+        self.cache_dir = Path(cache_dir)
+        self.width = width
+        self.height = height
+        self._workers = workers
+        self._mp_context = mp_context or multiprocessing.get_context(START_METHOD)
+        self._pool = self._new_pool()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self._workers, mp_context=self._mp_context)
+
+    def _path(self, name):
+        try:
+            return self.lattices[name]
+        except KeyError:
+            raise UnknownTile(f"Unknown lattice: {name}")
+
+    def info(self, name):
+        parsed = _load(self._path(name))
+        return {"s_min": float(parsed.s_min),
+                "s_max": float(parsed.s_max),
+                "max_zoom": MAX_ZOOM,
+                "tile_width": self.width,
+                "tile_height": self.height}
+
+    def tile(self, name, zoom, index):
+        """Return the path of the rendered tile, rendering it first if needed."""
+        path = self._path(name)
+        if not (0 <= zoom <= MAX_ZOOM and 0 <= index < 2**zoom):
+            raise UnknownTile(f"No tile {index} at zoom {zoom}")
+
+        version = os.stat(path).st_mtime_ns
+        size = f"{self.width}x{self.height}"
+        out_path = self.cache_dir / f"{name}-{version}-{size}" / str(zoom) / f"{index}.png"
+        if out_path.exists():
+            return out_path
+
+        key = (path, version, zoom, index)
+        future, pool = self._render(key, out_path)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            # A worker died and took the pool with it, so retry once on a fresh
+            # pool rather than failing every request from now on.
+            self._forget(key, future, pool)
+            future, _ = self._render(key, out_path)
+            return future.result()
+
+    def _render(self, key, out_path):
+        path, _, zoom, index = key
+        with self._lock:
+            # Concurrent requests for the same tile share a single render.
+            if key in self._pending:
+                return self._pending[key]
+            pool = self._pool
+            try:
+                future = pool.submit(render_tile, path, zoom, index, out_path, self.width, self.height)
+            except BrokenProcessPool:
+                pool = self._pool = self._new_pool()
+                future = pool.submit(render_tile, path, zoom, index, out_path, self.width, self.height)
+            self._pending[key] = future, pool
+
+        # Registered outside the lock: if the future is already done the
+        # callback runs straight away in this thread and takes the lock itself.
+        future.add_done_callback(lambda done: self._forget(key, done, pool))
+        return future, pool
+
+    def _forget(self, key, future, pool):
+        with self._lock:
+            if self._pending.get(key, (None,))[0] is future:
+                del self._pending[key]
+            broken = not future.cancelled() and isinstance(future.exception(), BrokenProcessPool)
+            if broken and self._pool is pool:
+                pool.shutdown(wait=False)
+                self._pool = self._new_pool()
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        renderer = self.server.renderer
+        try:
+            match = _TILE_PATH.match(self.path)
+            if match:
+                tile = renderer.tile(match["lattice"], int(match["zoom"]), int(match["index"]))
+                self._respond(tile.read_bytes(), "image/png")
+                return
+
+            match = _INFO_PATH.match(self.path)
+            if match:
+                body = json.dumps(renderer.info(match["lattice"])).encode()
+                self._respond(body, "application/json")
+                return
+        except UnknownTile as e:
+            self.send_error(404, str(e))
+            return
+        except UnsupportedLattice as e:
+            self.send_error(422, str(e))
+            return
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+
+        self.send_error(404)
+
+    def _respond(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(lattices, cache_dir, host="127.0.0.1", port=8000, workers=None):
+    renderer = TileRenderer(lattices, cache_dir, workers=workers)
+    server = ThreadingHTTPServer((host, port), TileRequestHandler)
+    server.renderer = renderer
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        renderer.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve lattice tiles over HTTP.")
+    parser.add_argument("lattices", nargs="+", metavar="NAME=PATH")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--cache-dir", default=Path(tempfile.gettempdir()) / "latdraw-tiles")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    lattices = dict(spec.split("=", 1) for spec in args.lattices)
+    serve(lattices, args.cache_dir, host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+import matplotlib
+
+# Select the backend before anything imports pyplot.
+matplotlib.use("Agg")
@@ -19,3 +19,36 @@ def test_content(response):
     # from bs4 import BeautifulSoup
     # assert 'GitHub' in BeautifulSoup(response.content).title.string
     del response
+
+
+def test_layout_labels_stacks_overlapping_labels():
+    from latdraw.latdraw import layout_labels
+
+    lanes = layout_labels([0, 1, 2, 10], [5, 5, 5, 5], nlanes=2)
+
+    assert list(lanes) == [0, 1, -1, 0]
+
+
+def test_static_labels_follow_zoom():
+    import matplotlib.pyplot as plt
+
+    from latdraw import lattice
+    from latdraw.latdraw import StaticLabels
+
+    def visible_labels():
+        return [text.get_text() for text in ax.texts if text.get_visible()]
+
+    quads = [lattice.Quadrupole(f"Q{i}", [0, 0, i + 0.5], 0.5, 0.1) for i in range(1000)]
+    fig, ax = plt.subplots()
+    ax.set_xlim(0, 1000)
+    labels = StaticLabels(ax, quads, nlanes=2)
+    zoomed_out = visible_labels()
+
+    ax.set_xlim(0, 10)
+    labels.update()
+    zoomed_in = visible_labels()
+
+    assert 0 < len(zoomed_out) < len(quads)
+    assert len(ax.texts) < len(quads)
+    assert sorted(zoomed_in) == sorted(f"Q{i}" for i in range(10))
+    plt.close(fig)
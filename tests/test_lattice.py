@@ -85,3 +85,153 @@ def test_init_VKicker():
     assert sbend.length == LENGTH
     assert sbend.angle == angle
     
+
+
+def _fodo_cells(ncells):
+    elements = []
+    s = 0
+    for i in range(ncells):
+        s += LENGTH
+        elements.append(lattice.Quadrupole(f"qf{i}", [0, 0, s], LENGTH, 0.1))
+        s += 2
+        elements.append(lattice.Drift(f"d{i}a", [0, 0, s], 2))
+        s += LENGTH
+        elements.append(lattice.Quadrupole(f"qd{i}", [0, 0, s], LENGTH, -0.1))
+        s += 2
+        elements.append(lattice.Drift(f"d{i}b", [0, 0, s], 2))
+    return elements
+
+def test_compress_repeated_cells():
+    elements = ([lattice.Marker("start", [0, 0, 0])]
+                + _fodo_cells(100)
+                + [lattice.Sextupole("sext", [0, 0, 501], 1, 0.3)])
+    beamline = lattice.Beamline(elements)
+    compressed = beamline.compress()
+
+    assert compressed.ncells == 3
+    assert len(compressed) == len(beamline)
+    for original, expanded in zip(beamline, compressed):
+        assert type(expanded) is type(original)
+        assert expanded.name == original.name
+        assert expanded.length == original.length
+        np.testing.assert_allclose(expanded.position, original.position)
+
+    assert compressed[-2].name == "d99b"
+    np.testing.assert_allclose(compressed[-2].position, [0, 0, 500])
+
+def test_compress_does_not_merge_different_strengths():
+    elements = _fodo_cells(10)
+    elements[20].k1 = 0.2
+    compressed = lattice.Beamline(elements).compress()
+
+    assert compressed[20].k1 == 0.2
+    assert compressed[24].k1 == 0.1
+
+def test_compressed_add_offset():
+    compressed = lattice.Beamline(_fodo_cells(10)).compress()
+    compressed.add_offset([1, 0, 0])
+
+    assert all(element.position[0] == 1 for element in compressed)
+
+def test_sample_k1_profile():
+    beamline = lattice.Beamline(_fodo_cells(2))
+    s = np.array([-1, 0.25, 1, 2.4, 2.75, 4, 5.25, 20])
+
+    np.testing.assert_allclose(beamline.sample(s, "k1"), [0, 0.1, 0, 0, -0.1, 0, 0.1, 0])
+    np.testing.assert_allclose(beamline.sample(s, "k1", integrated=True),
+                               [0, 0.05, 0, 0, -0.05, 0, 0.05, 0])
+
+def test_sample_types_and_indices():
+    beamline = lattice.Beamline([lattice.Marker("start", [0, 0, 0])] + _fodo_cells(1))
+    s = [-1, 0, 0.6, 10]
+
+    assert list(beamline.sample(s, "type")) == ["", "Quadrupole", "Drift", ""]
+    assert list(beamline.element_indices(s)) == [-1, 1, 2, -1]
+
+def test_validate_clean_beamline():
+    report = lattice.Beamline(_fodo_cells(5)).validate()
+
+    assert report.ok
+    assert str(report) == "Beamline OK"
+
+def test_validate_reports_problems():
+    elements = [lattice.Quadrupole("q0", [0, 0, 1], 1, 0.1),
+                lattice.Drift("gap", [0, 0, 3], 1),
+                lattice.Quadrupole("q1", [0, 0, 4], 1, np.nan),
+                lattice.Drift("overlap", [0, 0, 3.5], 1),
+                lattice.Quadrupole("thin", [0, 0, 3.5], 0, 0.1),
+                lattice.Drift("d", [0, 0, 4.5], 1),
+                lattice.Drift("overlap2", [0, 0, 5], 1)]
+
+    report = lattice.Beamline(elements).validate()
+
+    assert not report.ok
+    assert list(report.gaps) == [1]
+    assert list(report.decreasing_s) == [3]
+    assert list(report.overlaps) == [6]
+    assert list(report.zero_length_magnets) == [4]
+    assert list(report.non_finite_strengths) == [2]
+    assert "q1 (2)" in str(report)
+
+def test_validate_without_continuity():
+    elements = _fodo_cells(2)
+    elements[3].position = np.array([0, 0, -5])
+
+    assert lattice.Beamline(elements).validate(check_continuity=False).ok
+
+def test_compress_keeps_misc_per_element():
+    quadrupoles = [lattice.Quadrupole(f"q{i}", [0, 0, i + 1], 1, 0.1, tag=f"t{i}") for i in range(4)]
+    compressed = lattice.Beamline(quadrupoles).compress()
+
+    assert [element.misc["tag"] for element in compressed] == ["t0", "t1", "t2", "t3"]
+
+def test_compressed_elements_have_own_misc():
+    quadrupoles = [lattice.Quadrupole(f"q{i}", [0, 0, i + 1], 1, 0.1, tag="a") for i in range(4)]
+    compressed = lattice.Beamline(quadrupoles).compress()
+    compressed[0].misc["x"] = 1
+
+    assert compressed.ncells == 1
+    assert compressed[0].misc == compressed[2].misc == {"tag": "a"}
+
+def test_element_indices_nested_elements():
+    beamline = lattice.Beamline([lattice.Solenoid("sol", [0, 0, 10], 10, 0.5),
+                                 lattice.Quadrupole("q", [0, 0, 6], 1, 0.1)])
+    s = [-1, 2, 5.5, 8, 10]
+
+    assert list(beamline.element_indices(s)) == [-1, 0, 1, 0, -1]
+    np.testing.assert_allclose(beamline.sample(s, "k1"), [0, 0, 0.1, 0, 0])
+    np.testing.assert_allclose(beamline.sample(s, "ks"), [0, 0.5, 0, 0.5, 0])
+
+def test_validate_non_finite_geometry():
+    elements = _fodo_cells(2)
+    elements[2].position = np.array([0, 0, np.nan])
+    elements[5].length = np.nan
+
+    report = lattice.Beamline(elements).validate()
+
+    assert not report.ok
+    assert list(report.non_finite_geometry) == [2, 5]
+
+def test_compress_positions_with_limited_precision():
+    # Positions as they would come out of a file written with 10 significant
+    # figures, at the km scale of a real machine.
+    elements = []
+    s = 1000.
+    for i in range(500):
+        for name, length, k1 in [("qf", 0.313712345678, 0.1), ("da", 2.718281828459, None),
+                                 ("qd", 0.313712345678, -0.1), ("db", 3.141592653589, None)]:
+            s += length
+            position = [0, 0, float(f"{s:.10g}")]
+            if k1 is None:
+                elements.append(lattice.Drift(f"{name}{i}", position, length))
+            else:
+                elements.append(lattice.Quadrupole(f"{name}{i}", position, length, k1))
+    beamline = lattice.Beamline(elements)
+
+    compressed = beamline.compress()
+    assert compressed.ncells == 1
+    assert len(compressed._offsets) == 1
+    for original, expanded in zip(beamline, compressed):
+        np.testing.assert_allclose(expanded.position, original.position, rtol=0, atol=1e-4)
+
+    assert len(beamline.compress(tolerance=1e-12)._offsets) > 1
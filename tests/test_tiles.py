@@ -0,0 +1,168 @@
+import concurrent.futures
+import multiprocessing
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures.process import BrokenProcessPool
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from latdraw import interfaces
+from latdraw import lattice
+from latdraw import tiles
+
+
+@pytest.fixture
+def lattice_file(tmp_path, monkeypatch):
+    cell = []
+    for i in range(100):
+        s = 2.0 * i
+        cell.append(lattice.Quadrupole(f"q{i}", [0, 0, s + 0.5], 0.5, (-1)**i * 0.1))
+        cell.append(lattice.Drift(f"d{i}", [0, 0, s + 2], 1.5))
+    monkeypatch.setattr(interfaces, "read", lambda path: lattice.Beamline(cell))
+
+    path = tmp_path / "lattice.tfs"
+    path.write_text("")
+    tiles._parse.cache_clear()
+    return path
+
+
+def test_tile_ranges_cover_lattice(lattice_file):
+    parsed = tiles._load(str(lattice_file))
+
+    assert parsed.tile_range(0, 0) == (0, 200)
+    assert parsed.tile_range(2, 3) == (150, 200)
+
+
+def test_elements_between(lattice_file):
+    parsed = tiles._load(str(lattice_file))
+    names = [element.name for element in parsed.elements_between(10, 14)]
+
+    assert names[0] == "q4"
+    assert names[-1] == "q7"
+    assert "q5" in names and "q6" in names
+
+
+def test_render_tile(lattice_file, tmp_path):
+    out_path = tiles.render_tile(str(lattice_file), 3, 1, tmp_path / "tiles" / "3" / "1.png")
+
+    assert out_path.read_bytes().startswith(b"\x89PNG")
+
+
+def test_unknown_tile(lattice_file, tmp_path):
+    renderer = tiles.TileRenderer({"ring": lattice_file}, tmp_path / "cache", workers=1)
+    try:
+        with pytest.raises(tiles.UnknownTile):
+            renderer.tile("linac", 0, 0)
+        with pytest.raises(tiles.UnknownTile):
+            renderer.tile("ring", 2, 4)
+        assert renderer.info("ring")["s_max"] == 200
+    finally:
+        renderer.shutdown()
+
+
+def test_unsupported_lattices():
+    with pytest.raises(tiles.UnsupportedLattice):
+        tiles._ParsedLattice(lattice.Beamline([]))
+
+    survey = lattice.Beamline([lattice.Drift("d0", [0, 0, 2], 2),
+                               lattice.Drift("d1", [1, 0, 1], 2)])
+    with pytest.raises(tiles.UnsupportedLattice):
+        tiles._ParsedLattice(survey)
+
+
+class _ImmediatePool:
+    """Stand-in for a process pool that renders in the calling thread."""
+    def __init__(self, broken=False):
+        self.broken = broken
+        self.submitted = 0
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        future = concurrent.futures.Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool())
+        else:
+            future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def _tile_in_thread(renderer, *args):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(renderer.tile(*args)), daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive(), "tile() did not return"
+    return result[0]
+
+
+def test_tile_with_already_completed_future(lattice_file, tmp_path):
+    renderer = tiles.TileRenderer({"ring": lattice_file}, tmp_path / "cache", workers=1)
+    renderer._pool.shutdown()
+    renderer._pool = _ImmediatePool()
+
+    tile = _tile_in_thread(renderer, "ring", 1, 0)
+
+    assert tile.read_bytes().startswith(b"\x89PNG")
+    assert f"{tiles.TILE_WIDTH}x{tiles.TILE_HEIGHT}" in str(tile)
+    assert not renderer._pending
+
+
+def test_tile_recovers_from_broken_pool(lattice_file, tmp_path, monkeypatch):
+    renderer = tiles.TileRenderer({"ring": lattice_file}, tmp_path / "cache", workers=1)
+    renderer._pool.shutdown()
+    renderer._pool = _ImmediatePool(broken=True)
+    monkeypatch.setattr(renderer, "_new_pool", _ImmediatePool)
+
+    tile = _tile_in_thread(renderer, "ring", 1, 1)
+
+    assert tile.exists()
+    assert not renderer._pool.broken
+
+
+def test_serve_tiles_over_http(lattice_file, tmp_path):
+    # fork so that the workers see the monkeypatched reader.
+    renderer = tiles.TileRenderer({"ring": lattice_file}, tmp_path / "cache", workers=2,
+                                  mp_context=multiprocessing.get_context("fork"))
+    submitted = []
+    submit = renderer._pool.submit
+    renderer._pool.submit = lambda *args: submitted.append(args) or submit(*args)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), tiles.TileRequestHandler)
+    server.renderer = renderer
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def fetch(path):
+        with urllib.request.urlopen(url + path, timeout=30) as response:
+            return response.headers["Content-Type"], response.read()
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            responses = list(executor.map(fetch, ["/ring/4/3.png"] * 2))
+        cached = fetch("/ring/4/3.png")
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            fetch("/linac/0/0.png")
+    finally:
+        server.shutdown()
+        server.server_close()
+        renderer.shutdown()
+
+    assert len(submitted) == 1
+    for content_type, body in responses + [cached]:
+        assert content_type == "image/png"
+        assert body.startswith(b"\x89PNG")
+    assert error.value.code == 404
+
+
+def test_workers_are_not_forked_by_default(lattice_file, tmp_path):
+    renderer = tiles.TileRenderer({"ring": lattice_file}, tmp_path / "cache")
+    try:
+        assert renderer._pool._mp_context.get_start_method() in {"forkserver", "spawn"}
+    finally:
+        renderer.shutdown()